@@ -1,14 +1,25 @@
 # deep_research_reddit.py (stateful, single-zip download, empty prompt override)
 # Streamlit assistant for genre-based Reddit deep research tailored for screen-writers and producers.
 
-import os, json, time, random, io, zipfile
+import os, re, json, time, random, io, zipfile, asyncio, hashlib, threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import List, Dict, Callable
+from typing import List, Dict, Iterator, Tuple, Union
 
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx
 from dotenv import load_dotenv
+import httpx
 import openai
+from aiolimiter import AsyncLimiter
 import praw
+import diskcache
+import tiktoken
+from praw.exceptions import RedditAPIException
+from praw.models import MoreComments
+from prawcore.exceptions import ServerError, TooManyRequests
+from tenacity import AsyncRetrying, retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 # ── PASSWORD PROTECTION ─────────────────────────────────────────────────────
 st.set_page_config(page_title="Reddit Research", layout="centered")
@@ -26,130 +37,476 @@ if not st.session_state["authenticated"]:
             st.error("Incorrect password.")
     st.stop()
 
-# ── CSS: Verdana 14 pt everywhere ────────────────────────────────────────────
-st.markdown(
-    """
-    <style>
-    html, body, [class*="css"], .stMarkdown, .stTextInput, .stButton, .stSlider label {
-        font-family: Verdana, sans-serif !important;
-        font-size: 14px !important;
-    }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
-
 # ── ENV / KEYS ───────────────────────────────────────────────────────────────
 load_dotenv()
-openai.api_key        = os.getenv("OPENAI_API_KEY", "")
+OPENAI_API_KEY        = os.getenv("OPENAI_API_KEY", "")
 REDDIT_CLIENT_ID      = os.getenv("REDDIT_CLIENT_ID", "")
 REDDIT_CLIENT_SECRET  = os.getenv("REDDIT_CLIENT_SECRET", "")
 REDDIT_USER_AGENT     = os.getenv("REDDIT_USER_AGENT", "DeepResearch/0.1")
 
-if not all([openai.api_key, REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET]):
+if not all([OPENAI_API_KEY, REDDIT_CLIENT_ID, REDDIT_CLIENT_SECRET]):
     st.error("🚨 Set your OpenAI & Reddit credentials via env-vars or a .env file.")
     st.stop()
 
 # ── REDDIT CLIENT ────────────────────────────────────────────────────────────
-reddit = praw.Reddit(
-    client_id=REDDIT_CLIENT_ID,
-    client_secret=REDDIT_CLIENT_SECRET,
-    user_agent=REDDIT_USER_AGENT,
-)
+@st.cache_resource
+def get_reddit() -> praw.Reddit:
+    # one client (and HTTP session / OAuth token) shared across reruns and sessions
+    return praw.Reddit(
+        client_id=REDDIT_CLIENT_ID,
+        client_secret=REDDIT_CLIENT_SECRET,
+        user_agent=REDDIT_USER_AGENT,
+    )
+
+reddit = get_reddit()
+
+# ── OPENAI CLIENTS ───────────────────────────────────────────────────────────
+@st.cache_resource
+def get_openai() -> openai.OpenAI:
+    # one pooled HTTP/2 connection set shared across reruns and sessions
+    return openai.OpenAI(api_key=OPENAI_API_KEY, http_client=httpx.Client(http2=True))
+
+def _async_openai() -> openai.AsyncOpenAI:
+    # async pools are bound to the event loop that opened them, so this is built once per
+    # asyncio.run (i.e. per pipeline run) rather than cached; tenacity owns retries
+    return openai.AsyncOpenAI(
+        api_key=OPENAI_API_KEY,
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            http2=True,
+            limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+        ),
+    )
 
 # ── Helpers ──────────────────────────────────────────────────────────────────
-GENRE_DEFAULT_SUB = {
-    "horror": "horror",
-    "sci-fi": "scifi",
-    "rom-com": "romcom",
-    "superhero": "marvelstudios",
-    "documentary": "documentaries",
-    "animation": "animation",
-    "crime": "TrueFilm",
-    "thriller": "Thrillers",
+# Several canonical subs per genre; fetched together as one combined r/a+b+c listing
+GENRE_DEFAULT_SUB: Dict[str, List[str]] = {
+    "horror": ["horror", "horrormovies", "HorrorReviewed"],
+    "sci-fi": ["scifi", "printSF"],
+    "rom-com": ["romcom"],
+    "superhero": ["marvelstudios", "DC_Cinematic"],
+    "documentary": ["documentaries"],
+    "animation": ["animation"],
+    "crime": ["TrueFilm", "TrueCrime"],
+    "thriller": ["Thrillers"],
 }
 
-def fetch_threads(sub: str, limit: int, timer_cb: Callable[[], None]) -> List[Dict]:
-    threads = []
-    for post in reddit.subreddit(sub).new(limit=limit):
-        post.comments.replace_more(limit=None)
-        comments = " ".join(c.body for c in post.comments.list())
-        threads.append({
-            "id": post.id,
-            "title": post.title,
-            "body": post.selftext or "",
-            "comments": comments,
-            "url": post.url,
-            "created": datetime.fromtimestamp(post.created_utc, tz=timezone.utc).strftime("%Y-%m-%d"),
-        })
-        timer_cb()
-    return threads
+# Transient API failures are retried with jittered backoff instead of aborting the whole run
+RETRY_WAIT = wait_random_exponential(min=1, max=30)
+RETRY_STOP = stop_after_attempt(5)
+# 4xx errors (bad key, rejected schema, unknown model) won't fix themselves, so they surface
+OPENAI_TRANSIENT_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)
+# TooManyRequests: the worker threads share one PRAW client, whose rate limiter isn't thread-safe
+REDDIT_TRANSIENT_ERRORS = (RedditAPIException, ServerError, TooManyRequests)
+_reddit_retry = retry(
+    wait=RETRY_WAIT,
+    stop=RETRY_STOP,
+    retry=retry_if_exception_type(REDDIT_TRANSIENT_ERRORS),
+    reraise=True,
+)
 
-def summarise_threads(threads: List[Dict], progress_bar, status_slot, sample_slot, timer_cb: Callable[[], None], model: str = "gpt-4o", batch: int = 6) -> None:
-    total = len(threads)
-    done = 0
-    for i in range(0, total, batch):
-        chunk = threads[i:i + batch]
-        payload = {
-            t["id"]: f"{t['title']}\n\n{t['body'][:4000]}\n\nComments:\n{t['comments'][:6000]}"
-            for t in chunk
-        }
-        status_slot.markdown(f"**Summarising:** {chunk[0]['title'][:80]}…")
-        sample_thread = random.choice(threads)
-        sample_slot.markdown(f"*Random thread:* **{sample_thread['title'][:90]}**")
-
-        msgs = [
-            {
-                "role": "system",
-                "content": (
-                    "Summarize the Reddit thread. Extract atleast 2 key insights and assess overall sentiment (positive/negative/neutral/mixed). Focus on main discussion points and community mood. Output JSON . For each Reddit thread JSON {id:text} return JSON with keys "
-                    "gist (50 words), insight1, insight2, sentiment (positive/neutral/negative)."
-                ),
+# downstream only ever reads the first few KB, so truncate once at fetch time
+BODY_CHAR_CAP = 4000
+COMMENT_CHAR_CAP = 6000
+
+def _expand_comments(post, comment_depth: int) -> Iterator:
+    # BFS the already-fetched forest, only expanding MoreComments down to `comment_depth`
+    # (top level = 1; 0 never expands). Lazy, so the caller stops the walk at its char cap
+    # instead of flattening the whole tree, and MoreComments past the cap are never fetched.
+    seen = set()
+    queue = deque((c, 1) for c in post.comments)
+    while queue:
+        node, depth = queue.popleft()
+        if isinstance(node, MoreComments):
+            if depth <= comment_depth:
+                queue.extend((c, depth) for c in node.comments())
+            continue
+        if node.id in seen:
+            continue
+        seen.add(node.id)
+        yield node
+        queue.extend((c, depth + 1) for c in node.replies)
+
+@st.cache_resource
+def get_reddit_cache() -> diskcache.Cache:
+    # persists hydrated posts across sessions so repeat runs only fetch new/changed threads
+    return diskcache.Cache("./.reddit_cache", size_limit=2**30)
+
+REDDIT_CACHE_FRESH_SECS = 6 * 3600
+
+@_reddit_retry
+def _hydrate(post, comment_depth: int = 0) -> Dict:
+    cache = get_reddit_cache()
+    key = f"{post.id}:{comment_depth}"
+    hit = cache.get(key)
+    if hit and time.time() - hit["fetched_at"] < REDDIT_CACHE_FRESH_SECS and hit["num_comments"] == post.num_comments:
+        return hit["thread"]
+
+    buf, total = [], 0
+    # post.comments triggers a full submission fetch; the listing already tells us when it's empty
+    comment_iter = _expand_comments(post, comment_depth) if post.num_comments else ()
+    for c in comment_iter:
+        body = c.body
+        buf.append(body)
+        total += len(body) + 1
+        if total >= COMMENT_CHAR_CAP:
+            break
+    comments = "\n".join(buf)[:COMMENT_CHAR_CAP]
+    thread = {
+        "id": post.id,
+        "title": post.title,
+        "body": (post.selftext or "")[:BODY_CHAR_CAP],
+        "comments": comments,
+        "url": post.url,
+        "created": datetime.fromtimestamp(post.created_utc, tz=timezone.utc).strftime("%Y-%m-%d"),
+    }
+    cache.set(key, {"thread": thread, "fetched_at": time.time(), "num_comments": post.num_comments}, expire=24 * 3600)
+    return thread
+
+FETCH_CONCURRENCY = 16  # posts hydrated at once; PRAW's rate limiter still paces the requests
+
+@_reddit_retry
+def _list_posts(sub: str, limit: int) -> List:
+    return list(reddit.subreddit(sub).new(limit=limit))  # one listing call
+
+@st.cache_data(ttl=15 * 60, show_spinner=False)
+def fetch_threads(sub: Union[str, List[str]], limit: int, comment_depth: int = 0) -> List[Dict]:
+    # pure and memoised: widget tweaks that rerun the script don't refetch from Reddit
+    if not isinstance(sub, str):
+        sub = "+".join(sub)  # one combined listing call instead of one per subreddit
+    posts = _list_posts(sub, limit)
+    # comment expansion is I/O-bound on Reddit; overlap it across posts
+    threads: List = [None] * len(posts)
+    with ThreadPoolExecutor(max_workers=FETCH_CONCURRENCY) as ex:
+        futures = {ex.submit(_hydrate, p, comment_depth): i for i, p in enumerate(posts)}
+        for fut in as_completed(futures):
+            try:
+                threads[futures[fut]] = fut.result()
+            except REDDIT_TRANSIENT_ERRORS:
+                print(f"Skipping post {posts[futures[fut]].id}: Reddit kept failing")
+    return [t for t in threads if t is not None]  # listing order
+
+ENC = tiktoken.get_encoding("o200k_base")  # gpt-4o family tokenizer
+
+_URL_ONLY = re.compile(r"^\S*https?://\S+$")
+
+def _compress_comments(text: str, target_chars: int) -> str:
+    # cheap lexical compression: drop quotes, one-liners ("this", "lol") and bare links,
+    # dedupe, then keep the longest (most substantive) lines up to the budget, trimming the
+    # last one to fit so a single wall-of-text comment still contributes
+    lines = (l.strip() for l in text.splitlines())
+    kept = dict.fromkeys(
+        l for l in lines
+        if len(l) >= 15 and not l.startswith(">") and not _URL_ONLY.match(l)
+    )
+    out, n = [], 0
+    for l in sorted(kept, key=len, reverse=True):
+        room = target_chars - n
+        if room < 15:
+            break
+        l = l[:room]
+        out.append(l)
+        n += len(l) + 1
+    return "\n".join(out)
+
+def _payload_text(t: Dict) -> str:
+    return f"{t['title']}\n\n{t['body']}\n\nComments:\n{_compress_comments(t['comments'], 3000)}"
+
+SUMMARY_OUT_TOKENS = 200      # one `summaries` entry; SUMMARIZE_SYSTEM caps it at ~100 words (~150 tokens + JSON)
+MAX_COMPLETION_TOKENS = 12000  # headroom under the 16k completion cap of the mini models
+
+def _pack_chunks(threads: List[Dict], max_tokens: int = 80000) -> Iterator[List[Tuple[Dict, str]]]:
+    # greedily fill each request up to a token budget (input + expected output) instead of a
+    # fixed thread count, so the system prompt and round-trip are paid once per many threads;
+    # the output side also keeps every reply under the model's completion limit
+    # payload text is built once per thread and yielded with it, so the request body reuses it;
+    # one parallel, GIL-releasing tokenizer pass over every payload instead of N encode() calls
+    texts = [_payload_text(t) for t in threads]
+    token_counts = map(len, ENC.encode_batch(texts, num_threads=8, disallowed_special=()))
+    chunk, tokens_in, tokens_out = [], 0, 0
+    for t, text, n in zip(threads, texts, token_counts):
+        over_budget = tokens_in + n + tokens_out + SUMMARY_OUT_TOKENS >= max_tokens
+        over_output = tokens_out + SUMMARY_OUT_TOKENS > MAX_COMPLETION_TOKENS
+        if chunk and (over_budget or over_output):
+            yield chunk
+            chunk, tokens_in, tokens_out = [], 0, 0
+        chunk.append((t, text))
+        tokens_in += n
+        tokens_out += SUMMARY_OUT_TOKENS
+    if chunk:
+        yield chunk
+
+# Structured outputs: the API guarantees schema-valid JSON, so one stray token can't sink a whole batch
+SUMMARY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "Summaries",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "summaries": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string"},
+                            "gist": {"type": "string"},
+                            "insight1": {"type": "string"},
+                            "insight2": {"type": "string"},
+                            "sentiment": {"type": "string", "enum": ["positive", "neutral", "negative"]},
+                        },
+                        "required": ["id", "gist", "insight1", "insight2", "sentiment"],
+                        "additionalProperties": False,
+                    },
+                },
             },
-            {"role": "user", "content": json.dumps(payload)},
-        ]
-        resp = openai.chat.completions.create(model=model, messages=msgs)
-        summaries = {}
-        try:
-            summaries = json.loads(resp.choices[0].message.content)
-        except Exception:
-            print("Json exception")
-        for t in chunk:
-            t["summary"] = summaries.get(t["id"], {})
-        done += len(chunk)
+            "required": ["summaries"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Stable routing keys so the provider's prefix cache can reuse the static leading messages
+SUMMARY_PROMPT_CACHE_KEY = "summariser-v1"
+REPORT_PROMPT_CACHE_KEY = "report-v1"
+
+def _parse_summaries(content: str) -> Dict[str, Dict]:
+    return {s.pop("id"): s for s in json.loads(content)["summaries"]}
+
+@st.cache_resource
+def _summary_cache() -> diskcache.Cache:
+    # content-addressed and on disk, so re-runs only send new or changed threads to OpenAI
+    return diskcache.Cache("./.summary_cache")
+
+def _summary_key(t: Dict, model: str) -> str:
+    h = hashlib.blake2b(digest_size=16)
+    for part in (_SUMMARY_PROMPT_FINGERPRINT, model, t["title"], t["body"], t["comments"]):
+        h.update(part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+def _load_cached_summaries(threads: List[Dict], model: str, out: Dict[str, Dict]) -> List[Dict]:
+    cache = _summary_cache()
+    todo = []
+    for t in threads:
+        hit = cache.get(_summary_key(t, model))
+        if hit is not None:
+            out[t["id"]] = hit
+        else:
+            todo.append(t)
+    return todo
+
+def _store_summaries(chunk: List[Dict], summaries: Dict[str, Dict], model: str, out: Dict[str, Dict]) -> None:
+    cache = _summary_cache()
+    for t in chunk:
+        out[t["id"]] = summaries.get(t["id"], {})
+        if out[t["id"]]:
+            cache[_summary_key(t, model)] = out[t["id"]]
+
+# ── Prompt templates (built once at import, not per call) ────────────────────
+SUMMARIZE_SYSTEM = (
+    "Summarize the Reddit thread. Extract atleast 2 key insights and assess overall sentiment (positive/negative/neutral). Focus on main discussion points and community mood. Output JSON . For each Reddit thread in the JSON {id:text} return one entry in `summaries` with keys "
+    "id, gist (≤50 words), insight1 (≤25 words), insight2 (≤25 words), sentiment (positive/neutral/negative)."
+)
+_SUM_SYSTEM_MSG = {"role": "system", "content": SUMMARIZE_SYSTEM}
+
+# Part of every summary-cache key, so cached summaries go stale when the prompt or schema
+# changes. Bump the version when _payload_text/_compress_comments change what the model sees.
+SUMMARY_PAYLOAD_VERSION = "2"
+_SUMMARY_PROMPT_FINGERPRINT = hashlib.blake2b(
+    "\0".join([SUMMARY_PAYLOAD_VERSION, SUMMARIZE_SYSTEM, json.dumps(SUMMARY_RESPONSE_FORMAT, sort_keys=True)]).encode(),
+    digest_size=16,
+).hexdigest()
+
+REPORT_DEFAULT_PROMPT = (
+    "You are a senior analyst and researcher assisting business executives who are exploring the "
+    "**{genre}** topic. You have mined Reddit community and audience discussions. "
+    "First, give a one-paragraph snapshot of overall audience sentiment for this topic. "
+    "Then, answer each research question in its own subsection (≤2 paragraphs each), "
+    "adding citations in [Title](URL) form right after every key evidence point. "
+    "Finish with a bold **list of ACTIONABLE INSIGHTS** lists 3 points for business executives (what to emphasise / avoid in a script), each with a citation."
+)
+REPORT_CUSTOM_PREFIX = "You are doing research on: **{genre}** topic. "
+
+def _summary_messages(chunk: List[Tuple[Dict, str]]) -> List[Dict]:
+    payload = {t["id"]: text for t, text in chunk}
+    # compact separators: fewer bytes and tokens sent per request
+    return [_SUM_SYSTEM_MSG, {"role": "user", "content": json.dumps(payload, separators=(",", ":"))}]
+
+async def _summarize_one_batch(client: openai.AsyncOpenAI, chunk: List[Tuple[Dict, str]], model: str, limiter: AsyncLimiter) -> Dict[str, Dict]:
+    msgs = _summary_messages(chunk)
+    async for attempt in AsyncRetrying(
+        wait=RETRY_WAIT,
+        stop=RETRY_STOP,
+        retry=retry_if_exception_type(OPENAI_TRANSIENT_ERRORS),
+        reraise=True,
+    ):
+        with attempt:
+            async with limiter:
+                resp = await client.chat.completions.create(
+                    model=model,
+                    messages=msgs,
+                    response_format=SUMMARY_RESPONSE_FORMAT,
+                    max_completion_tokens=MAX_COMPLETION_TOKENS,
+                    extra_body={"prompt_cache_key": SUMMARY_PROMPT_CACHE_KEY},
+                )
+    # strict json_schema output always parses unless the reply was cut off or refused.
+    # A cut-off reply means the packed chunk wanted more output than budgeted: split it
+    # and summarise the halves, down to a single thread, rather than drop every thread.
+    choice = resp.choices[0]
+    if choice.finish_reason == "length" and len(chunk) > 1:
+        mid = len(chunk) // 2
+        left, right = await asyncio.gather(
+            _summarize_one_batch(client, chunk[:mid], model, limiter),
+            _summarize_one_batch(client, chunk[mid:], model, limiter),
+        )
+        return {**left, **right}
+    if choice.finish_reason != "stop" or not choice.message.content:
+        print(f"Summary batch returned no usable JSON ({choice.finish_reason})")
+        return {}
+    return _parse_summaries(choice.message.content)
+
+def _summary_rows(threads: List[Dict], summaries: Dict[str, Dict]) -> List[Dict]:
+    return [{"title": t["title"], **summaries.get(t["id"], {}), "url": t["url"]} for t in threads]
+
+async def _summarise_async(threads: List[Dict], progress_bar, status_slot, sample_slot, model: str, max_tokens: int, max_concurrency: int, max_rpm: int, results_slot) -> Dict[str, Dict]:
+    total = len(threads)
+    out: Dict[str, Dict] = {}
+    todo = _load_cached_summaries(threads, model, out)
+    done = total - len(todo)
+    rendered = _summary_rows([t for t in threads if t["id"] in out], out)
+    sample_iter = iter(random.sample([t["title"] for t in threads], k=len(threads)))  # distinct previews, shuffled once
+    sem = asyncio.Semaphore(max_concurrency)
+    limiter = AsyncLimiter(max_rate=max_rpm, time_period=60)  # only waits once the RPM budget is spent
+
+    async def _summarize_chunk(client: openai.AsyncOpenAI, chunk: List[Tuple[Dict, str]]):
+        chunk_threads = [t for t, _ in chunk]
+        async with sem:
+            status_slot.markdown(f"**Summarising:** {chunk_threads[0]['title'][:80]}…")
+            sample_slot.markdown(f"*Random thread:* **{next(sample_iter, '')[:90]}**")
+            try:
+                return chunk_threads, await _summarize_one_batch(client, chunk, model, limiter)
+            except OPENAI_TRANSIENT_ERRORS:
+                print("Summary batch failed after retries")
+                return chunk_threads, {}
+
+    if done:  # show cache hits up front; if everything was cached there is no batch to do it
         progress_bar.progress(done / total)
-        timer_cb()
-        time.sleep(0.5)
+        if results_slot is not None:
+            results_slot.json(rendered)
+
+    chunks = list(_pack_chunks(todo, max_tokens))
+    async with _async_openai() as client:
+        # consume batches in completion order so the UI tracks whatever is in flight
+        for fut in asyncio.as_completed([_summarize_chunk(client, c) for c in chunks]):
+            chunk, summaries = await fut
+            _store_summaries(chunk, summaries, model, out)
+            done += len(chunk)
+            progress_bar.progress(done / total)
+            if results_slot is not None:
+                rendered.extend(_summary_rows(chunk, out))
+                results_slot.json(rendered)
     status_slot.markdown("**Summarising complete!**")
-
-def generate_report(genre: str, threads: List[Dict], questions: List[str], user_prompt: str, timer_cb: Callable[[], None]) -> str:
-    corpus = "\n\n".join(
-        f"{t['title']} – {t['summary'].get('gist','')} [URL]({t['url']})" for t in threads
-    )[:15000]
+    return out
+
+def summarise_threads(threads: List[Dict], progress_bar, status_slot, sample_slot, model: str = "gpt-4o-mini", max_tokens: int = 80000, max_concurrency: int = 8, max_rpm: int = 500, results_slot=None) -> Dict[str, Dict]:
+    # batches are independent, so overlap their OpenAI round-trips instead of running them back to back
+    return asyncio.run(_summarise_async(threads, progress_bar, status_slot, sample_slot, model, max_tokens, max_concurrency, max_rpm, results_slot))
+
+def summarise_threads_batch(threads: List[Dict], progress_bar, status_slot, model: str = "gpt-4o-mini", poll_secs: int = 30, results_slot=None) -> Dict[str, Dict]:
+    # Batch API: half the token price and no sync RPM pressure, at the cost of turnaround time.
+    # No RPM limit to amortise here, so one request per thread: a bad line only loses that thread.
+    out: Dict[str, Dict] = {}
+    todo = _load_cached_summaries(threads, model, out)
+    if not todo:
+        progress_bar.progress(1.0)
+        status_slot.markdown("**Summarising complete!** (all cached)")
+        return out
+    lines = [
+        json.dumps({
+            "custom_id": t["id"],
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": {
+                "model": model,
+                "messages": _summary_messages([(t, _payload_text(t))]),
+                "response_format": SUMMARY_RESPONSE_FORMAT,
+                "max_completion_tokens": MAX_COMPLETION_TOKENS,
+                "prompt_cache_key": SUMMARY_PROMPT_CACHE_KEY,
+            },
+        })
+        for t in todo
+    ]
+    batch_file = get_openai().files.create(file=("summaries.jsonl", "\n".join(lines).encode()), purpose="batch")
+    job = get_openai().batches.create(input_file_id=batch_file.id, endpoint="/v1/chat/completions", completion_window="24h")
+    while job.status not in ("completed", "failed", "expired", "cancelled"):
+        status_slot.markdown(f"**Batch {job.id}:** {job.status}…")
+        time.sleep(poll_secs)
+        job = get_openai().batches.retrieve(job.id)
+        counts = job.request_counts
+        if counts and counts.total:
+            progress_bar.progress(counts.completed / counts.total)
+
+    results = {}
+    if job.status == "completed" and job.output_file_id:
+        for line in get_openai().files.content(job.output_file_id).text.splitlines():
+            row = json.loads(line)
+            try:
+                summary = _parse_summaries(row["response"]["body"]["choices"][0]["message"]["content"])
+                results[row["custom_id"]] = next(iter(summary.values()))
+            except Exception:
+                print("Json exception")
+    _store_summaries(todo, results, model, out)
+    progress_bar.progress(1.0)
+    if results_slot is not None:
+        results_slot.json(_summary_rows(threads, out))
+    status_slot.markdown(f"**Summarising complete!** (batch {job.status})")
+    return out
+
+CORPUS_TOKEN_BUDGET = 4000  # ≈ the old 15k-char cap, but exact in tokens
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _build_corpus(rows: tuple) -> str:
+    # memoised on (title, gist, url) rows so re-asking different questions reuses it
+    lines = []
+    for title, gist, url in rows:
+        lines.append(f"{title} – {gist} [URL]({url})")
+    tokens = ENC.encode("\n\n".join(lines), disallowed_special=())
+    return ENC.decode(tokens[:CORPUS_TOKEN_BUDGET])
+
+def generate_report(genre: str, threads: List[Dict], questions: List[str], user_prompt: str, report_slot=None) -> str:
+    corpus = _build_corpus(tuple((t["title"], t["summary"].get("gist", ""), t["url"]) for t in threads))
 
     q_block = "\n".join(f"Q{i+1}. {q}" for i, q in enumerate(questions))
 
     # If user_prompt is empty, use the original default prompt verbatim
     if not user_prompt.strip():
-        prompt = (
-            "You are a senior analyst and researcher assisting business executives who are exploring the "
-            f"**{genre.title()}** topic. You have mined Reddit community and audience discussions. "
-            "First, give a one-paragraph snapshot of overall audience sentiment for this topic. "
-            "Then, answer each research question in its own subsection (≤2 paragraphs each), "
-            "adding citations in [Title](URL) form right after every key evidence point. "
-            "Finish with a bold **list of ACTIONABLE INSIGHTS** lists 3 points for business executives (what to emphasise / avoid in a script), each with a citation."
-        )
+        prompt = REPORT_DEFAULT_PROMPT.format_map({"genre": genre.title()})
     else:
-        prompt = f"You are doing research on: **{genre.title()}** topic. " + user_prompt.strip()
+        prompt = REPORT_CUSTOM_PREFIX.format_map({"genre": genre.title()}) + user_prompt.strip()
 
+    # Static prefix first (prompt, then corpus), variable questions last, so prefix caching hits
     msgs = [
         {"role": "system", "content": prompt},
         {"role": "assistant", "content": f"CORPUS ({len(threads)} threads):\n{corpus}"},
         {"role": "user", "content": q_block},
     ]
-    resp = openai.chat.completions.create(model="gpt-4o", messages=msgs)
-    timer_cb()
-    return resp.choices[0].message.content
+    stream = get_openai().chat.completions.create(
+        model="gpt-4o",
+        messages=msgs,
+        stream=True,
+        extra_body={"prompt_cache_key": REPORT_PROMPT_CACHE_KEY},
+    )
+    # render tokens as they arrive so the user sees the report at time-to-first-token
+    buf = []
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        buf.append(chunk.choices[0].delta.content or "")
+        if report_slot is not None:
+            report_slot.markdown("".join(buf))
+    return "".join(buf)
 
 # ── UI ──────────────────────────────────────────────────────────────────────
 st.title("generalized reddit data extractor & analytics")
@@ -162,13 +519,20 @@ def tick():
     mins, secs = divmod(int(elapsed), 60)
     ticker.write(f"⏱️ {mins:02d}:{secs:02d}")
 
+def _tick_loop(stop: threading.Event) -> None:
+    # one clock thread at 2 Hz instead of ticking from every fetch/summary/report step
+    while not stop.wait(0.5):
+        tick()
+
 col1, col2 = st.columns([2, 1])
 with col1:
     genre_input = st.text_input("Film/TV genre or enter the topic you want to research about", value="horror").strip().lower()
 with col2:
     n_posts = st.slider("Threads", 10, 200, 50, step=10)
 
-subreddit = st.text_input("Subreddit", value="horror").strip()
+subreddit_input = st.text_input("Subreddit(s) – separate several with + or commas; leave empty for genre defaults", value="horror")
+subreddits = [s for s in re.split(r"[+,\s]+", subreddit_input) if s] or GENRE_DEFAULT_SUB.get(genre_input, [])
+subreddit = "+".join(subreddits)
 
 st.markdown("#### Research questions (1-5, one per line)")
 qs_text = st.text_area("Questions", "What tropes feel over-used?\nWhat excites this audience?", label_visibility="collapsed")
@@ -182,6 +546,9 @@ user_prompt_input = st.text_area(
     height=140,
 )
 
+summary_model = st.selectbox("Summariser model", ["gpt-4o-mini", "gpt-4.1-mini", "gpt-4o"], index=0)
+use_batch_api = st.checkbox("⚡ Use Batch API (cheaper, slower)", value=False)
+
 # ── Run pipeline and persist to session state ───────────────────────────────
 run_clicked = st.button("Run research 🚀")
 
@@ -193,22 +560,38 @@ if run_clicked:
         st.error("Enter at least one research question.")
         st.stop()
 
-    with st.spinner("⛏️ Fetching threads + comments…"):
-        raw_threads = fetch_threads(subreddit, n_posts, tick)
-        threads = json.loads(json.dumps(raw_threads))  # safe copy for summaries
-
-    progress = st.progress(0.0)
-    status = st.empty()
-    sample_preview = st.empty()
-    with st.spinner("📝 Summarizing…"):
-        summarise_threads(threads, progress, status, sample_preview, tick)
-
-    with st.spinner("🧠 Crafting final report…"):
-        report_md = generate_report(genre_input, threads, questions, user_prompt_input, tick)
+    stop_clock = threading.Event()
+    clock = threading.Thread(target=_tick_loop, args=(stop_clock,), daemon=True)
+    add_script_run_ctx(clock)  # lets the thread write to this session's sidebar
+    clock.start()
+    try:
+        with st.spinner("⛏️ Fetching threads + comments…"):
+            raw_threads = fetch_threads(subreddits, n_posts)
+
+        progress = st.progress(0.0)
+        status = st.empty()
+        sample_preview = st.empty()
+        results_preview = st.empty()
+        with st.spinner("📝 Summarizing…"):
+            if use_batch_api:
+                summaries = summarise_threads_batch(raw_threads, progress, status, model=summary_model, results_slot=results_preview)
+            else:
+                summaries = summarise_threads(raw_threads, progress, status, sample_preview, model=summary_model, results_slot=results_preview)
+        threads = [{**t, "summary": summaries.get(t["id"], {})} for t in raw_threads]
+        results_preview.empty()  # shown again in the "Gists & insights" expander below
+
+        report_preview = st.empty()
+        with st.spinner("🧠 Crafting final report…"):
+            report_md = generate_report(genre_input, threads, questions, user_prompt_input, report_preview)
+        report_preview.empty()  # the full report is rendered below from session state
+    finally:
+        stop_clock.set()
+        clock.join()
 
     # Persist results to session so a rerun (e.g., after download) does NOT lose state
     st.session_state["raw_threads"] = raw_threads
     st.session_state["threads"] = threads
+    st.session_state["summaries"] = summaries
     st.session_state["report_md"] = report_md
     st.session_state["subreddit_val"] = subreddit
     st.session_state["genre_val"] = genre_input
@@ -217,10 +600,11 @@ if run_clicked:
 if "report_md" in st.session_state and "threads" in st.session_state:
     st.success(f"Summarized {len(st.session_state['threads'])} threads from r/{st.session_state['subreddit_val']}.")
     with st.expander("🔍 Gists & insights"):
-        st.json([
-            {"title": t["title"], **t.get("summary", {}), "url": t["url"]}
-            for t in st.session_state["threads"]
-        ])
+        # one thread at a time: only the selected row is serialised and sent to the browser
+        rows = _summary_rows(st.session_state["threads"], st.session_state["summaries"])
+        if rows:
+            idx = st.number_input(f"Thread (1-{len(rows)})", min_value=1, max_value=len(rows), value=1, step=1)
+            st.json(rows[idx - 1])
 
     st.markdown("## 📊 Audience-Driven Report")
     st.markdown(st.session_state["report_md"])